@@ -263,13 +263,15 @@ def get_learner_fn(
                     # latter based on how likely a' is under the current policy (s' and a' are
                     # samples from replay).
                     # See [Munos et al., 2016](https://arxiv.org/abs/1606.02647) for more.
+                    # Retrace operates on time-major inputs. The error is only reduced with
+                    # a mean so it is left in its [T, B] layout.
                     retrace_error = batch_retrace_continuous(
-                        online_q_t[:, :-1],
-                        target_q_t[:, 1:-1],
-                        v_t[:, 1:],
-                        r_t[:, :-1],
-                        d_t[:, :-1],
-                        log_rhos[:, 1:-1],
+                        jnp.swapaxes(online_q_t[:, :-1], 0, 1),
+                        jnp.swapaxes(target_q_t[:, 1:-1], 0, 1),
+                        jnp.swapaxes(v_t[:, 1:], 0, 1),
+                        jnp.swapaxes(r_t[:, :-1], 0, 1),
+                        jnp.swapaxes(d_t[:, :-1], 0, 1),
+                        jnp.swapaxes(log_rhos[:, 1:-1], 0, 1),
                         config.system.retrace_lambda,
                     )
                     q_loss = rlax.l2_loss(retrace_error).mean()
@@ -279,6 +281,7 @@ def get_learner_fn(
                         d_t[:, :-1],
                         v_t[:, 1:],
                         config.system.n_step_for_sequence_bootstrap,
+                        time_major=False,
                     )
                     td_error = online_q_t[:, :-1] - n_step_value_target
                     q_loss = rlax.l2_loss(td_error).mean()
@@ -265,6 +265,7 @@ def get_learner_fn(
                     (1 - sequence.done)[:, :-1] * config.system.gamma,
                     config.system.gae_lambda,
                     sequence.search_value,
+                    time_major=False,
                 )
 
                 # CALCULATE VALUE LOSS
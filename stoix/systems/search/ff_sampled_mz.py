@@ -365,13 +365,22 @@ def get_learner_fn(
             ) -> Tuple:
                 """Calculate the total MuZero loss."""
 
+                # Swap the sampled sequences to time-major [T, B, ...] once so that neither
+                # the value targets nor the unroll below need any further transposes.
+                action = jnp.swapaxes(sequence.action, 0, 1)
+                reward = jnp.swapaxes(sequence.reward, 0, 1)
+                search_policy = jnp.swapaxes(sequence.search_policy, 0, 1)
+                search_value = jnp.swapaxes(sequence.search_value, 0, 1)
+                done = jnp.swapaxes(sequence.done, 0, 1)
+                sampled_actions = jnp.swapaxes(sequence.sampled_actions, 0, 1)
+
                 # Calculate the value targets using n-step bootstrapped returns
                 # with the search values
-                r_t = sequence.reward[:, :-1]
-                d_t = 1.0 - sequence.done.astype(jnp.float32)
+                r_t = reward[:-1]
+                d_t = 1.0 - done.astype(jnp.float32)
                 d_t = (d_t * config.system.gamma).astype(jnp.float32)
-                d_t = d_t[:, :-1]
-                search_values = sequence.search_value[:, 1:]
+                d_t = d_t[:-1]
+                search_values = search_value[1:]
                 value_targets = batch_n_step_bootstrapped_returns(
                     r_t, d_t, search_values, config.system.n_steps
                 )
@@ -457,15 +466,14 @@ def get_learner_fn(
                     return (total_loss, next_state_embedding, muzero_params, mask, key), None
 
                 targets = (
-                    sequence.action[:, :-1],
-                    sequence.reward[:, :-1],
-                    sequence.search_policy[:, :-1],
+                    action[:-1],
+                    reward[:-1],
+                    search_policy[:-1],
                     value_targets,
-                    sequence.done[:, :-1],
-                    sequence.sampled_actions[:, :-1],
-                )  # B, T
+                    done[:-1],
+                    sampled_actions[:-1],
+                )  # T, B
 
-                targets = jax.tree_map(lambda x: jnp.swapaxes(x, 0, 1), targets)  # T, B
                 init_total_loss = {
                     "actor": jnp.array(0.0),
                     "value": jnp.array(0.0),
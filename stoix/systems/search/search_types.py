@@ -20,6 +20,14 @@ DynamicsApply = Callable[[FrozenDict, chex.Array, chex.Array], Tuple[chex.Array,
 
 
 class ExItTransition(NamedTuple):
+    """Transition collected by the search agents.
+
+    The rollout scan emits transitions time-major ([T, B, ...]). They are swapped to
+    batch-major ([B, T, ...]) before being added to the trajectory buffer, so sampled
+    sequences are batch-major. The MuZero learners swap the fields they unroll over back to
+    time-major once, up front, while the AlphaZero learners use them batch-major.
+    """
+
     done: Done
     action: Action
     reward: chex.Array
@@ -30,6 +38,8 @@ class ExItTransition(NamedTuple):
 
 
 class SampledExItTransition(NamedTuple):
+    """`ExItTransition` that also stores the actions sampled at the search root."""
+
     done: chex.Array
     action: Action
     sampled_actions: chex.Array
@@ -79,17 +79,20 @@ def get_learner_fn(
         # CALCULATE ADVANTAGE
         params, opt_states, key, env_state, last_timestep = learner_state
         last_val = critic_apply_fn(params.critic_params, last_timestep.observation)
-        # Swap the batch and time axes.
-        traj_batch = jax.tree_map(lambda x: jnp.swapaxes(x, 0, 1), traj_batch)
-
+        # The rollout is time-major, so compute the returns before swapping it.
         r_t = traj_batch.reward
-        v_t = jnp.concatenate([traj_batch.value, last_val[..., jnp.newaxis]], axis=-1)[:, 1:]
+        v_t = jnp.concatenate([traj_batch.value, last_val[None, ...]], axis=0)[1:]
         d_t = 1.0 - traj_batch.done.astype(jnp.float32)
         d_t = (d_t * config.system.gamma).astype(jnp.float32)
         monte_carlo_returns = batch_n_step_bootstrapped_returns(
             r_t, d_t, v_t, config.system.rollout_length
         )
 
+        # Swap the batch and time axes.
+        traj_batch, monte_carlo_returns = jax.tree_map(
+            lambda x: jnp.swapaxes(x, 0, 1), (traj_batch, monte_carlo_returns)
+        )
+
         def _actor_loss_fn(
             actor_params: FrozenDict,
             observations: chex.Array,
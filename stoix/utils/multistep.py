@@ -1,4 +1,5 @@
-from typing import Tuple, Union
+from functools import partial
+from typing import Optional, Tuple, Union
 
 import chex
 import jax
@@ -9,13 +10,38 @@ import jax.numpy as jnp
 # which can be much slower.
 
 
+def _linear_recurrence_combine(
+    later: Tuple[chex.Array, chex.Array], earlier: Tuple[chex.Array, chex.Array]
+) -> Tuple[chex.Array, chex.Array]:
+    """Associative operator for the backwards recurrence xₜ = aₜ + bₜ * xₜ₊₁.
+
+    Composing the affine maps of two adjacent segments gives another affine map, which allows
+    the recurrence to be evaluated with `jax.lax.associative_scan(..., reverse=True)` in
+    O(log T) depth rather than T sequential steps.
+    """
+    a_later, b_later = later
+    a_earlier, b_earlier = earlier
+    return a_earlier + b_earlier * a_later, b_earlier * b_later
+
+
+def _scan_unroll(length: int, unroll: Optional[int]) -> int:
+    """Returns the unroll factor for a scan of the given length.
+
+    Short scans are fully unrolled so XLA does not emit a while loop for them, while longer
+    scans are capped at 16 unrolled iterations. An explicit `unroll` always takes precedence.
+    """
+    if unroll is not None:
+        return unroll
+    return max(1, min(16, length))
+
+
 def batch_truncated_generalized_advantage_estimation(
     r_t: chex.Array,
     discount_t: chex.Array,
     lambda_: Union[chex.Array, chex.Scalar],
     values: chex.Array,
     stop_target_gradients: bool = True,
-    time_major: bool = False,
+    time_major: bool = True,
 ) -> Tuple[chex.Array, chex.Array]:
     """Computes truncated generalized advantage estimates for a sequence length k.
 
@@ -46,54 +72,117 @@ def batch_truncated_generalized_advantage_estimation(
     """
     # Swap axes to make time axis the first dimension
     if not time_major:
-        batch_size = r_t.shape[0]
-        r_t, discount_t, values = jax.tree_map(
-            lambda x: jnp.swapaxes(x, 0, 1), (r_t, discount_t, values)
-        )
-    else:
-        batch_size = r_t.shape[1]
+        r_t = jnp.swapaxes(r_t, 0, 1)
+        discount_t = jnp.swapaxes(discount_t, 0, 1)
+        values = jnp.swapaxes(values, 0, 1)
 
     chex.assert_type([r_t, values, discount_t], float)
 
-    lambda_ = jnp.ones_like(discount_t) * lambda_  # If scalar, make into vector.
-
+    # The advantages follow the linear recurrence Âₜ = δₜ + γₜλₜ * Âₜ₊₁, which is solved
+    # backwards in time with a parallel associative scan.
     delta_t = r_t + discount_t * values[1:] - values[:-1]
-
-    # Iterate backwards to calculate advantages.
-    def _body(
-        acc: chex.Array, xs: Tuple[chex.Array, chex.Array, chex.Array]
-    ) -> Tuple[chex.Array, chex.Array]:
-        deltas, discounts, lambda_ = xs
-        acc = deltas + discounts * lambda_ * acc
-        return acc, acc
-
-    _, advantage_t = jax.lax.scan(
-        _body, jnp.zeros(batch_size), (delta_t, discount_t, lambda_), reverse=True, unroll=16
+    advantage_t, _ = jax.lax.associative_scan(
+        _linear_recurrence_combine, (delta_t, discount_t * lambda_), reverse=True
     )
 
     target_values = values[:-1] + advantage_t
 
     if not time_major:
         # Swap axes back to original shape
-        advantage_t, target_values = jax.tree_map(
-            lambda x: jnp.swapaxes(x, 0, 1), (advantage_t, target_values)
-        )
+        advantage_t = jnp.swapaxes(advantage_t, 0, 1)
+        target_values = jnp.swapaxes(target_values, 0, 1)
 
     if stop_target_gradients:
-        advantage_t, target_values = jax.tree_map(
-            lambda x: jax.lax.stop_gradient(x), (advantage_t, target_values)
-        )
+        advantage_t, target_values = jax.lax.stop_gradient((advantage_t, target_values))
 
     return advantage_t, target_values
 
 
+# Jitted GAE for callers outside of a compiled update step that no longer need the rollout
+# rewards and discounts. Both have the same shape as the outputs, so XLA can write the
+# advantages and targets into the donated buffers instead of allocating new ones. Inside an
+# enclosing jit the donation is a no-op, as XLA already manages intermediate buffers there.
+donated_batch_truncated_generalized_advantage_estimation = partial(
+    jax.jit,
+    static_argnames=("stop_target_gradients", "time_major"),
+    donate_argnums=(0, 1),
+)(batch_truncated_generalized_advantage_estimation)
+
+
+def _constant_discount_n_step_returns(
+    r_t: chex.Array, discount: chex.Scalar, bootstrap_t: chex.Array, n: int
+) -> chex.Array:
+    """Time-major n-step returns for a constant discount and lambda == 1.
+
+    The discounted reward sums are a 1D correlation of the rewards with the kernel
+    [γ⁰, γ¹, ..., γⁿ⁻¹], so they are computed in a single pass instead of n scan steps. Windows
+    running past the end of the sequence are truncated, and their bootstrap values are only
+    discounted by the number of remaining steps.
+    """
+    seq_len = r_t.shape[0]
+    kernel = discount ** jnp.arange(n)
+    r_t = jnp.pad(r_t, ((0, n - 1), (0, 0)))
+    # Use full precision so the result matches the elementwise scan path on TPUs and GPUs.
+    reward_sums = jax.vmap(
+        lambda x: jnp.correlate(x, kernel, mode="valid", precision=jax.lax.Precision.HIGHEST),
+        in_axes=1,
+        out_axes=1,
+    )(r_t)
+    num_steps = jnp.minimum(n, seq_len - jnp.arange(seq_len))
+    return reward_sums + (discount**num_steps)[:, jnp.newaxis] * bootstrap_t
+
+
+def _scanned_n_step_returns(
+    r_t: chex.Array,
+    discount_t: Union[chex.Array, chex.Scalar],
+    v_t: chex.Array,
+    targets: chex.Array,
+    n: int,
+    lambda_t: Union[chex.Array, chex.Scalar],
+    unroll: Optional[int],
+) -> chex.Array:
+    """Time-major n-step returns, computed by scanning backwards over the n step offsets."""
+    seq_len = r_t.shape[0]
+
+    # A scalar lambda is closed over by the scan body rather than broadcast to a (T, B) array.
+    scalar_lambda = jnp.ndim(lambda_t) == 0
+    if not scalar_lambda:
+        lambda_t = jnp.broadcast_to(lambda_t, r_t.shape)
+
+    # A scalar discount is only accepted here in combination with lambda mixing.
+    discount_t = jnp.broadcast_to(discount_t, r_t.shape)
+
+    time_idx = jnp.arange(seq_len)
+
+    # Work backwards to compute n-step returns. Rather than padding every input to T + n - 1
+    # steps, each step gathers the i-th shifted window directly. Past the end of the sequence
+    # the rewards are 0, the discounts and lambdas 1, and the clamped index repeats v_t[-1].
+    def _body(acc: chex.Array, i: chex.Array) -> Tuple[chex.Array, None]:
+        idx = time_idx + i
+        valid = (idx < seq_len)[:, jnp.newaxis]
+        idx = jnp.minimum(idx, seq_len - 1)
+        reward = jnp.where(valid, r_t[idx], 0.0)
+        discount = jnp.where(valid, discount_t[idx], 1.0)
+        v = v_t[idx]
+        lambda_ = lambda_t if scalar_lambda else jnp.where(valid, lambda_t[idx], 1.0)
+        acc = reward + discount * ((1.0 - lambda_) * v + lambda_ * acc)
+        return acc, None
+
+    targets, _ = jax.lax.scan(
+        _body, targets, jnp.arange(n), reverse=True, unroll=_scan_unroll(n, unroll)
+    )
+    return targets
+
+
 def batch_n_step_bootstrapped_returns(
     r_t: chex.Array,
-    discount_t: chex.Array,
+    discount_t: Union[chex.Array, chex.Scalar],
     v_t: chex.Array,
     n: int,
     lambda_t: float = 1.0,
     stop_target_gradients: bool = True,
+    time_major: bool = True,
+    unroll: Optional[int] = None,
 ) -> chex.Array:
     """Computes strided n-step bootstrapped return targets over a batch of sequences.
 
@@ -105,46 +194,52 @@ def batch_n_step_bootstrapped_returns(
 
         Gₜ = rₜ₊₁ + γₜ₊₁ * (rₜ₊₂ + γₜ₊₂ * (... * (rₜ₊ₙ + γₜ₊ₙ * vₜ₊ₙ ))).
 
+    If additionally the discount is a constant scalar, the returns are computed with a single
+    correlation over the rewards rather than a scan.
+
     Args:
-        r_t: rewards at times B x [1, ..., T].
-        discount_t: discounts at times B x [1, ..., T].
-        v_t: state or state-action values to bootstrap from at time B x [1, ...., T].
+        r_t: rewards at times [1, ..., T] x B.
+        discount_t: discounts at times [1, ..., T] x B, or a constant scalar discount.
+        v_t: state or state-action values to bootstrap from at time [1, ...., T] x B.
         n: number of steps over which to accumulate reward before bootstrapping.
-        lambda_t: lambdas at times B x [1, ..., T]. Shape is [], or B x [T-1].
+        lambda_t: lambdas at times [1, ..., T] x B. Shape is [], or [T] x B.
         stop_target_gradients: bool indicating whether or not to apply stop gradient
         to targets.
+        time_major: If True, the first dimension of the input tensors is the time
+        dimension. Otherwise inputs and outputs are batch-major, i.e. B x [1, ..., T].
+        unroll: number of scan iterations to unroll. Defaults to min(16, n). Ignored when the
+        constant-discount correlation is used, since there is no scan to unroll.
 
     Returns:
-        estimated bootstrapped returns at times B x [0, ...., T-1]
+        estimated bootstrapped returns at times [0, ...., T-1] x B
     """
-    # swap axes to make time axis the first dimension
-    r_t, discount_t, v_t = jax.tree_map(lambda x: jnp.swapaxes(x, 0, 1), (r_t, discount_t, v_t))
+    # Swap axes to make time axis the first dimension
+    if not time_major:
+        r_t = jnp.swapaxes(r_t, 0, 1)
+        if jnp.ndim(discount_t) > 0:
+            discount_t = jnp.swapaxes(discount_t, 0, 1)
+        v_t = jnp.swapaxes(v_t, 0, 1)
     seq_len = r_t.shape[0]
-    batch_size = r_t.shape[1]
-
-    # Maybe change scalar lambda to an array.
-    lambda_t = jnp.ones_like(discount_t) * lambda_t
 
     # Shift bootstrap values by n and pad end of sequence with last value v_t[-1].
     pad_size = min(n - 1, seq_len)
-    targets = jnp.concatenate([v_t[n - 1 :], jnp.array([v_t[-1]] * pad_size)], axis=0)
+    targets = jnp.concatenate(
+        [v_t[n - 1 :], jnp.broadcast_to(v_t[-1:], (pad_size,) + v_t.shape[1:])], axis=0
+    )
+
+    if jnp.ndim(discount_t) == 0 and isinstance(lambda_t, (int, float)) and lambda_t == 1.0:
+        targets = _constant_discount_n_step_returns(r_t, discount_t, targets, n)
+    else:
+        targets = _scanned_n_step_returns(r_t, discount_t, v_t, targets, n, lambda_t, unroll)
 
-    # Pad sequences. Shape is now (T + n - 1,).
-    r_t = jnp.concatenate([r_t, jnp.zeros((n - 1, batch_size))], axis=0)
-    discount_t = jnp.concatenate([discount_t, jnp.ones((n - 1, batch_size))], axis=0)
-    lambda_t = jnp.concatenate([lambda_t, jnp.ones((n - 1, batch_size))], axis=0)
-    v_t = jnp.concatenate([v_t, jnp.array([v_t[-1]] * (n - 1))], axis=0)
+    if not time_major:
+        # Swap axes back to original shape
+        targets = jnp.swapaxes(targets, 0, 1)
 
-    # Work backwards to compute n-step returns.
-    for i in reversed(range(n)):
-        r_ = r_t[i : i + seq_len]
-        discount_ = discount_t[i : i + seq_len]
-        lambda_ = lambda_t[i : i + seq_len]
-        v_ = v_t[i : i + seq_len]
-        targets = r_ + discount_ * ((1.0 - lambda_) * v_ + lambda_ * targets)
+    if stop_target_gradients:
+        targets = jax.lax.stop_gradient(targets)
 
-    targets = jnp.swapaxes(targets, 0, 1)
-    return jax.lax.select(stop_target_gradients, jax.lax.stop_gradient(targets), targets)
+    return targets
 
 
 def batch_general_off_policy_returns_from_q_and_v(
@@ -174,39 +269,38 @@ def batch_general_off_policy_returns_from_q_and_v(
     See "Safe and Efficient Off-Policy Reinforcement Learning" by Munos et al.
     (https://arxiv.org/abs/1606.02647).
 
+    All inputs are time-major, i.e. the first dimension is the time dimension.
+
     Args:
-      q_t: Q-values under π of actions executed by μ at times [1, ..., K - 1].
-      v_t: Values under π at times [1, ..., K].
-      r_t: rewards at times [1, ..., K].
-      discount_t: discounts at times [1, ..., K].
-      c_t: weights at times [1, ..., K - 1].
+      q_t: Q-values under π of actions executed by μ at times [1, ..., K - 1] x B.
+      v_t: Values under π at times [1, ..., K] x B.
+      r_t: rewards at times [1, ..., K] x B.
+      discount_t: discounts at times [1, ..., K] x B.
+      c_t: weights at times [1, ..., K - 1] x B.
       stop_target_gradients: bool indicating whether or not to apply stop gradient
         to targets.
 
     Returns:
       Off-policy estimates of the generalized returns from states visited at times
-      [0, ..., K - 1].
+      [0, ..., K - 1] x B.
     """
-    q_t, v_t, r_t, discount_t, c_t = jax.tree_map(
-        lambda x: jnp.swapaxes(x, 0, 1), (q_t, v_t, r_t, discount_t, c_t)
-    )
+    # The returns follow the linear recurrence Gₜ = aₜ + bₜ * Gₜ₊₁ with
+    # aₜ = rₜ₊₁ + γₜ₊₁ * (vₜ₊₁ - cₜ₊₁ * q(aₜ₊₁)) and bₜ = γₜ₊₁ * cₜ₊₁. Padding c and q with a
+    # trailing zero turns the final step into the pure bootstrap G_K-1 = r_K + γ_K * v_K, so
+    # the scan produces all K returns directly.
+    c_t = jnp.pad(c_t, ((0, 1), (0, 0)))
+    q_t = jnp.pad(q_t, ((0, 1), (0, 0)))
+
+    # Neither term depends on the returns, so both are built once up front and the scan
+    # only has to combine them.
+    drv = r_t + discount_t * (v_t - c_t * q_t)
+    coef = discount_t * c_t
+    returns, _ = jax.lax.associative_scan(_linear_recurrence_combine, (drv, coef), reverse=True)
 
-    g = r_t[-1] + discount_t[-1] * v_t[-1]  # G_K-1.
-
-    def _body(
-        acc: chex.Array, xs: Tuple[chex.Array, chex.Array, chex.Array, chex.Array, chex.Array]
-    ) -> Tuple[chex.Array, chex.Array]:
-        reward, discount, c, v, q = xs
-        acc = reward + discount * (v - c * q + c * acc)
-        return acc, acc
-
-    _, returns = jax.lax.scan(
-        _body, g, (r_t[:-1], discount_t[:-1], c_t, v_t[:-1], q_t), reverse=True
-    )
-    returns = jnp.concatenate([returns, g[jnp.newaxis]], axis=0)
+    if stop_target_gradients:
+        returns = jax.lax.stop_gradient(returns)
 
-    returns = jnp.swapaxes(returns, 0, 1)
-    return jax.lax.select(stop_target_gradients, jax.lax.stop_gradient(returns), returns)
+    return returns
 
 
 def batch_retrace_continuous(
@@ -224,30 +318,31 @@ def batch_retrace_continuous(
     See "Safe and Efficient Off-Policy Reinforcement Learning" by Munos et al.
     (https://arxiv.org/abs/1606.02647).
 
+    All inputs are time-major, i.e. the first dimension is the time dimension.
+
     Args:
-      q_tm1: Q-values at times [0, ..., K - 1].
+      q_tm1: Q-values at times [0, ..., K - 1] x B.
       q_t: Q-values evaluated at actions collected using behavior
-        policy at times [1, ..., K - 1].
-      v_t: Value estimates of the target policy at times [1, ..., K].
-      r_t: reward at times [1, ..., K].
-      discount_t: discount at times [1, ..., K].
+        policy at times [1, ..., K - 1] x B.
+      v_t: Value estimates of the target policy at times [1, ..., K] x B.
+      r_t: reward at times [1, ..., K] x B.
+      discount_t: discount at times [1, ..., K] x B.
       log_rhos: Log importance weight pi_target/pi_behavior evaluated at actions
-        collected using behavior policy [1, ..., K - 1].
+        collected using behavior policy [1, ..., K - 1] x B.
       lambda_: scalar or a vector of mixing parameter lambda.
       stop_target_gradients: bool indicating whether or not to apply stop gradient
         to targets.
 
     Returns:
-      Retrace error.
+      Retrace error at times [0, ..., K - 1] x B.
     """
 
-    c_t = jnp.minimum(1.0, jnp.exp(log_rhos)) * lambda_
+    # min(1, exp(x)) == exp(min(x, 0)), which avoids overflowing the exponential.
+    c_t = jnp.exp(jnp.minimum(log_rhos, 0.0)) * lambda_
 
     # The generalized returns are independent of Q-values and cs at the final
     # state.
-    target_tm1 = batch_general_off_policy_returns_from_q_and_v(q_t, v_t, r_t, discount_t, c_t)
-
-    target_tm1 = jax.lax.select(
-        stop_target_gradients, jax.lax.stop_gradient(target_tm1), target_tm1
+    target_tm1 = batch_general_off_policy_returns_from_q_and_v(
+        q_t, v_t, r_t, discount_t, c_t, stop_target_gradients
     )
     return target_tm1 - q_tm1
@@ -1,11 +1,19 @@
+import functools
+
 import jax
 from colorama import Fore, Style
 from omegaconf import DictConfig
 
 
+@functools.lru_cache(maxsize=None)
+def _num_devices() -> int:
+    """Number of available devices, cached since the first query initialises the backend."""
+    return int(jax.device_count())
+
+
 def check_total_timesteps(config: DictConfig) -> DictConfig:
     """Check if total_timesteps is set, if not, set it based on the other parameters"""
-    n_devices = len(jax.devices())
+    n_devices = _num_devices()
     if config.arch.total_timesteps is None:
         config.arch.total_timesteps = (
             n_devices
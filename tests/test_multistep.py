@@ -0,0 +1,22 @@
+import jax.numpy as jnp
+import numpy as np
+import pytest
+
+from stoix.utils.multistep import batch_n_step_bootstrapped_returns
+
+SEQ_LEN = 11
+BATCH_SIZE = 3
+DISCOUNT = 0.9
+
+
+@pytest.mark.parametrize("n", [1, 2, 3, 5, SEQ_LEN, SEQ_LEN + 3])
+def test_constant_discount_n_step_returns_match_scan(n: int) -> None:
+    """The correlation path for a scalar discount must match the scan over per-step discounts."""
+    rng = np.random.default_rng(0)
+    r_t = jnp.asarray(rng.normal(size=(SEQ_LEN, BATCH_SIZE)), jnp.float32)
+    v_t = jnp.asarray(rng.normal(size=(SEQ_LEN, BATCH_SIZE)), jnp.float32)
+
+    constant_discount_returns = batch_n_step_bootstrapped_returns(r_t, DISCOUNT, v_t, n)
+    scanned_returns = batch_n_step_bootstrapped_returns(r_t, jnp.full_like(r_t, DISCOUNT), v_t, n)
+
+    np.testing.assert_allclose(constant_discount_returns, scanned_returns, rtol=1e-5, atol=1e-5)